@@ -1,6 +1,8 @@
+import numpy as np
 import pytest
+from tensorflow import keras as K
 
-from cellx.layers import ConvBlock2D, ConvBlock3D
+from cellx.layers import ConvBlock2D, ConvBlock3D, Decoder2D, Encoder2D
 
 
 @pytest.mark.parametrize("layer", [ConvBlock2D, ConvBlock3D])
@@ -8,3 +10,27 @@ def test_layer_instantiation(layer):
     """Test instantiating network layers."""
     new_layer = layer()
     assert isinstance(new_layer, layer)
+
+
+@pytest.mark.parametrize(
+    "sampling", [None, K.layers.MaxPooling2D, K.layers.MaxPooling2D()]
+)
+def test_encoder2d_output_shape(sampling):
+    """Test encoder downsampling for the strided convolution default and
+    max pooling given as either a class or an instance."""
+    encoder = Encoder2D(sampling=sampling, layers=[8, 16])
+    x = np.random.random((2, 32, 32, 3)).astype(np.float32)
+    y = encoder(x, training=False)
+    assert y.shape == (2, 8, 8, 32)
+
+
+@pytest.mark.parametrize(
+    "sampling", [K.layers.UpSampling2D, K.layers.UpSampling2D()]
+)
+def test_decoder2d_output_shape(sampling):
+    """Test decoder upsampling with the sampling given as either a class
+    or an instance."""
+    decoder = Decoder2D(sampling=sampling, layers=[8, 16])
+    x = np.random.random((2, 8, 8, 32)).astype(np.float32)
+    y = decoder(x, training=False)
+    assert y.shape == (2, 32, 32, 32)
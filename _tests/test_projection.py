@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from scipy.stats import binned_statistic_2d
+
+from cellx.tools.projection import ManifoldProjection2D
+
+
+def _reference_projection(images, manifold, bins, output_shape):
+    """Baseline per-bin mean and placement, as implemented with
+    scipy.stats.binned_statistic_2d before the vectorized rewrite."""
+    s, xe, ye, bn = binned_statistic_2d(
+        manifold[:, 0],
+        manifold[:, 1],
+        [],
+        bins=bins,
+        statistic="count",
+        expand_binnumbers=True,
+    )
+
+    # one-based bin numbers, keyed as tuples
+    grid = {}
+    for idx, b in enumerate(zip(bn[0, :].tolist(), bn[1, :].tolist())):
+        grid.setdefault(b, []).append(images[idx])
+
+    full_bins = [int(b) for b in output_shape]
+    half_bins = [b // 2 for b in output_shape]
+    imgrid = np.zeros(
+        (
+            (full_bins[0] + 1) * bins + half_bins[0],
+            (full_bins[1] + 1) * bins + half_bins[1],
+            3,
+        ),
+        dtype="uint8",
+    )
+
+    for (xx, yy), stack in grid.items():
+        im = np.mean(np.stack(stack, axis=0), axis=0)
+        blockx = slice(
+            xx * full_bins[0] - half_bins[0],
+            (xx + 1) * full_bins[0] - half_bins[0],
+            1,
+        )
+        blocky = slice(
+            yy * full_bins[1] - half_bins[1],
+            (yy + 1) * full_bins[1] - half_bins[1],
+            1,
+        )
+        imgrid[blockx, blocky, :] = im
+
+    extent = (min(xe), max(xe), min(ye), max(ye))
+    return imgrid, extent
+
+
+@pytest.mark.parametrize("bins", [2, 4])
+def test_projection_matches_reference(bins):
+    """Test that the vectorized montage reproduces the baseline per-bin
+    mean and tile placement on a small synthetic dataset."""
+    rng = np.random.default_rng(42)
+    shape = (8, 8)
+    images = rng.integers(0, 255, size=(32,) + shape + (3,), dtype=np.uint8)
+    manifold = rng.normal(size=(32, 2))
+
+    projection = ManifoldProjection2D(images, output_shape=shape)
+    imgrid, extent = projection(manifold, bins=bins)
+
+    ref_imgrid, ref_extent = _reference_projection(images, manifold, bins, shape)
+
+    assert imgrid.shape == ref_imgrid.shape
+    # integer bin means floor while the baseline truncated the float mean,
+    # so allow the means to differ by one grey level
+    np.testing.assert_allclose(imgrid, ref_imgrid, atol=1)
+    np.testing.assert_allclose(extent, ref_extent)
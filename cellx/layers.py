@@ -1,3 +1,4 @@
+import inspect
 from typing import List, Optional, Union
 
 import tensorflow as tf
@@ -24,6 +25,14 @@ class ConvBlockBase(K.layers.Layer):
         Name of activation function.
     strides : int
         Stride of the convolution.
+
+    Notes
+    -----
+    The convolution is forced to channels-last (NHWC/NDHWC) regardless of
+    the global image data format, since tensor cores consume NHWC natively
+    and avoid automatic layout transposes. Callers should therefore feed
+    channels-last inputs. Use `set_keras_policy` to opt into fp16 compute,
+    which is required for the full tensor core speedup.
     """
 
     def __init__(
@@ -39,10 +48,26 @@ class ConvBlockBase(K.layers.Layer):
     ):
         super().__init__(name=name)
 
+        # force channels-last, overriding any global channels-first setting
+        kwargs.setdefault("data_format", "channels_last")
+
+        # the batchnorm shift subsumes the convolution bias
+        kwargs.setdefault("use_bias", False)
+
         self.conv = convolution(
             filters, kernel_size, strides=strides, padding=padding, **kwargs,
         )
-        self.norm = K.layers.BatchNormalization()
+
+        # the fused batchnorm kernel is a single op for 4D conv outputs,
+        # but is not supported for the 5D outputs of Conv3D; Keras 3
+        # removed the argument, so only pass it where it exists
+        norm_kwargs = {"axis": -1}
+        norm_params = inspect.signature(
+            K.layers.BatchNormalization.__init__
+        ).parameters
+        if "fused" in norm_params:
+            norm_kwargs["fused"] = True if convolution is K.layers.Conv2D else None
+        self.norm = K.layers.BatchNormalization(**norm_kwargs)
         self.activation = K.layers.Activation(activation)
 
         # store the config so that we can restore it later
@@ -55,17 +80,53 @@ class ConvBlockBase(K.layers.Layer):
         }
         self._config.update(kwargs)
 
-    def call(self, x, training: Optional[bool] = None):
-        """Return the result of the normalized convolution."""
+        # XLA fuses the batchnorm scale/shift and activation into the
+        # convolution epilogue, removing two full-tensor roundtrips;
+        # reduce_retracing relaxes shapes so that varying batch sizes do
+        # not each compile a new concrete function
+        self._fused_call = tf.function(
+            self._forward, jit_compile=True, reduce_retracing=True
+        )
+        self._has_signature = False
+
+    def _forward(self, x, training: Optional[bool] = None):
         conv = self.conv(x)
         conv = self.norm(conv, training=training)
         return self.activation(conv)
 
+    def build_with_signature(self, input_shape: tuple) -> None:
+        """Pin the compiled forward pass to a fixed NHWC input signature,
+        guaranteeing a single trace when the input shape is known."""
+        # use the layer compute dtype so the signature accepts the
+        # autocast inputs of e.g. a mixed_float16 policy
+        self._fused_call = tf.function(
+            self._forward,
+            input_signature=[
+                tf.TensorSpec(input_shape, self.compute_dtype),
+                tf.TensorSpec(shape=[], dtype=tf.bool),
+            ],
+            jit_compile=True,
+        )
+        self._has_signature = True
+
+    def call(self, x, training: Optional[bool] = None):
+        """Return the result of the normalized convolution."""
+        # a pinned signature requires a concrete training flag
+        if self._has_signature and not tf.is_tensor(training):
+            training = bool(training)
+        return self._fused_call(x, training)
+
     def get_config(self) -> dict:
         config = super().get_config()
         config.update(self._config)
         return config
 
+    @classmethod
+    def set_keras_policy(cls, policy: str = "mixed_float16"):
+        """Set the global Keras mixed precision policy, e.g. to enable fp16
+        tensor core convolutions."""
+        K.mixed_precision.set_global_policy(policy)
+
 
 class ConvBlock2D(ConvBlockBase):
     """ConvBlock2D."""
@@ -101,9 +162,14 @@ class EncoderDecoderBase(K.layers.Layer):
 
     The type of sampling (pooling, transpose convolution or stride) and the
     order (before or after convoluton) varies between the derived Encoder and
-    Decoder classes.
+    Decoder classes. The full stack is assembled once as a `K.Sequential`
+    model, so that it is traced as a single sub-graph rather than dispatched
+    layer-by-layer from a Python loop.
     """
 
+    # decoders sample before the convolution, encoders after
+    _sampling_first = False
+
     def __init__(
         self,
         convolution: ConvBlockBase = ConvBlock2D,
@@ -121,20 +187,48 @@ class EncoderDecoderBase(K.layers.Layer):
                 self.sampling = sampling
             strides = 1
         else:
-            self.sampling = lambda x: x
+            # a serializable identity, never added to the stack since the
+            # strided convolution already performs the sampling
+            self.sampling = K.layers.Lambda(tf.identity, name="identity_sampling")
             strides = 2
 
         # build the convolutional layer list
         self.layers = [convolution(strides=strides) for k in layers]
 
+        # assemble the full conv/sampling stack as one sequential model
+        self._model = K.Sequential(name=f"{name}_stack")
+        for idx, layer in enumerate(self.layers):
+            # conv blocks share an explicit name, uniquify for the graph
+            layer._name = f"{layer.name}_{idx}"
+            if sampling is None:
+                self._model.add(layer)
+            elif self._sampling_first:
+                self._model.add(self._make_sampling(sampling))
+                self._model.add(layer)
+            else:
+                self._model.add(layer)
+                self._model.add(self._make_sampling(sampling))
+
+        # store the raw constructor argument, not the built layer, so that
+        # a get_config round-trip rebuilds the same architecture
         self._config = {
-            "sampling": self.sampling,
+            "sampling": sampling,
             "layers": layers,
         }
         self._config.update(kwargs)
 
+    def _make_sampling(self, sampling) -> K.layers.Layer:
+        """Return a fresh sampling layer for a stage of the stack. Sequential
+        silently deduplicates repeated layer instances, so when given an
+        instance, rebuild an equivalent layer per stage from its config."""
+        if isinstance(sampling, K.layers.Layer):
+            config = sampling.get_config()
+            config.pop("name", None)
+            return type(sampling).from_config(config)
+        return sampling()
+
     def call(self, x, training: Optional[bool] = None):
-        raise NotImplementedError
+        return self._model(x, training=training)
 
     def get_config(self) -> dict:
         config = super().get_config()
@@ -143,21 +237,19 @@ class EncoderDecoderBase(K.layers.Layer):
 
 
 class Encoder2D(EncoderDecoderBase):
-    """Encoder2D."""
+    """Encoder2D.
 
-    def __init__(
-        self, convolution=ConvBlock2D, sampling=K.layers.MaxPooling2D, **kwargs
-    ):
+    Downsamples with strided convolutions by default, which halves the
+    kernel launches and feature map traffic per stage compared with a
+    stride-1 convolution followed by pooling. Pass e.g.
+    `sampling=K.layers.MaxPooling2D` to pool instead.
+    """
+
+    def __init__(self, convolution=ConvBlock2D, sampling=None, **kwargs):
         super().__init__(
             convolution=convolution, sampling=sampling, name="Encoder2D", **kwargs
         )
 
-    def call(self, x, training: Optional[bool] = None):
-        for layer in self.layers:
-            x = layer(x, training=training)
-            x = self.sampling(x)
-        return x
-
 
 class Encoder3D(EncoderDecoderBase):
     """Encoder3D."""
@@ -169,16 +261,12 @@ class Encoder3D(EncoderDecoderBase):
             convolution=convolution, sampling=sampling, name="Encoder3D", **kwargs
         )
 
-    def call(self, x, training: Optional[bool] = None):
-        for layer in self.layers:
-            x = layer(x, training=training)
-            x = self.sampling(x)
-        return x
-
 
 class Decoder2D(EncoderDecoderBase):
     """Decoder2D."""
 
+    _sampling_first = True
+
     def __init__(
         self, convolution=ConvBlock2D, sampling=K.layers.UpSampling2D, **kwargs
     ):
@@ -186,16 +274,12 @@ class Decoder2D(EncoderDecoderBase):
             convolution=convolution, sampling=sampling, name="Decoder2D", **kwargs
         )
 
-    def call(self, x, training: Optional[bool] = None):
-        for layer in self.layers:
-            x = self.sampling(x)
-            x = layer(x, training=training)
-        return x
-
 
 class Decoder3D(EncoderDecoderBase):
     """Decoder3D."""
 
+    _sampling_first = True
+
     def __init__(
         self, convolution=ConvBlock3D, sampling=K.layers.UpSampling3D, **kwargs
     ):
@@ -203,21 +287,44 @@ class Decoder3D(EncoderDecoderBase):
             convolution=convolution, sampling=sampling, name="Decoder3D", **kwargs
         )
 
-    def call(self, x, training: Optional[bool] = None):
-        for layer in self.layers:
-            x = self.sampling(x)
-            x = layer(x, training=training)
-        return x
-
 
 class Sampling(K.layers.Layer):
-    """Uses (z_mean, z_log_var) to sample z."""
+    """Uses (z_mean, z_log_var) to sample z.
 
+    Parameters
+    ----------
+    seed : int, optional
+        A seed for a dedicated random generator. If provided, the layer
+        draws a reproducible stream of fresh noise on each call, and avoids
+        contention on the global RNG state.
+    """
+
+    def __init__(self, seed: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.seed = seed
+        self._rng = None if seed is None else tf.random.Generator.from_seed(seed)
+
+    @tf.function(jit_compile=True)
     def call(self, inputs):
         z_mean, z_log_var = inputs
-        epsilon = K.backend.random_normal(shape=tf.shape(z_mean))
+
+        # use the static shape where possible, the dynamic shape op is a
+        # barrier to some XLA fusions
+        shape = z_mean.shape
+        if not shape.is_fully_defined():
+            shape = tf.shape(z_mean)
+        if self._rng is not None:
+            epsilon = self._rng.normal(shape)
+        else:
+            epsilon = tf.random.normal(shape)
+        # XLA fuses the exp, multiply and add into a single kernel
         return z_mean + tf.exp(0.5 * z_log_var) * epsilon
 
+    def get_config(self) -> dict:
+        config = super().get_config()
+        config.update({"seed": self.seed})
+        return config
+
 
 if __name__ == "__main__":
     # boilerplate
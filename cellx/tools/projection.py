@@ -1,27 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from scipy.stats import binned_statistic_2d
 from skimage.io import imread
 from skimage.transform import resize
 from tqdm import tqdm
 
+# OpenCV decode/resize is considerably faster than skimage, use it if
+# it is available
+try:
+    import cv2
+
+    _HAS_CV2 = True
+except ImportError:
+    _HAS_CV2 = False
+
+# numba lets us normalize a whole batch of images in one parallel kernel
+try:
+    import numba
+
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+# run the per-bin reduction on the GPU if cupy can see a device
+try:
+    import cupy as cp
+    from cupyx import scatter_add
+
+    _HAS_CUPY = cp.cuda.runtime.getDeviceCount() > 0
+except Exception:
+    _HAS_CUPY = False
+
+
+def _load_image(filename: str, output_shape: tuple = (64, 64)):
+    """Load an image and reshape it to output_shape."""
+    if _HAS_CV2:
+        # preserve the bit depth of e.g. 16-bit microscopy TIFFs, and note
+        # the (W, H) size order and the BGR channel order of OpenCV
+        image = cv2.imread(filename, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_ANYCOLOR)
+        if image is not None:
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            image = cv2.resize(
+                image,
+                (output_shape[1], output_shape[0]),
+                interpolation=cv2.INTER_AREA,
+            ).astype(np.float32)
+            return image
 
-def _load_and_normalize(filename: str, output_shape: tuple = (64, 64)):
-    """Load an image, reshape to output_shape and normalize."""
+    # fall back for formats OpenCV cannot decode
+    return resize(imread(filename), output_shape, preserve_range=True)
 
-    # reshape to a certain image size
-    image = resize(imread(filename), output_shape, preserve_range=True)
-    n_pixels = np.prod(output_shape)
-    n_channels = image.shape[-1]
 
-    a_std = lambda d: np.max([np.std(d), 1.0 / np.sqrt(n_pixels)])
-    nrm = lambda d: np.clip((d - np.mean(d)) / a_std(d), -4.0, 4.0)
+if _HAS_NUMBA:
 
-    for dim in range(n_channels):
-        image[..., dim] = nrm(image[..., dim])
+    @numba.njit(parallel=True, fastmath=True)
+    def _normalize_batch(images: np.ndarray) -> np.ndarray:
+        """Normalize a (B, H, W, C) batch of images in a single parallel
+        pass, fusing the normalization, rescale and clip into one kernel."""
+        n, h, w, c = images.shape
+        out = np.empty((n, h, w, c), dtype=np.uint8)
+        n_pixels = h * w
+        min_std = 1.0 / np.sqrt(n_pixels)
+        for b in numba.prange(n):
+            for k in range(c):
+                mu = 0.0
+                for i in range(h):
+                    for j in range(w):
+                        mu += images[b, i, j, k]
+                mu /= n_pixels
 
-    # TODO(arl): ????
-    image = np.clip(255.0 * ((image + 1.0) / 5.0), 0, 255)
-    return image
+                var = 0.0
+                for i in range(h):
+                    for j in range(w):
+                        d = images[b, i, j, k] - mu
+                        var += d * d
+                sd = max(np.sqrt(var / n_pixels), min_std)
+
+                for i in range(h):
+                    for j in range(w):
+                        v = (images[b, i, j, k] - mu) / sd
+                        v = min(max(v, -4.0), 4.0)
+                        v = min(max(255.0 * ((v + 1.0) / 5.0), 0.0), 255.0)
+                        out[b, i, j, k] = np.uint8(v)
+        return out
 
 
 class ManifoldProjection2D:
@@ -48,19 +110,79 @@ class ManifoldProjection2D:
         self._output_shape = output_shape
         self._images = None
 
+        # hoist constants used for per-image normalization out of the loop
+        self._min_std = 1.0 / np.sqrt(int(np.prod(output_shape)))
+
+        # scratch buffers reused across repeated projections
+        self._scratch = {}
+
         # check if `images` parameter is a list of strings or a numpy array
         # to preload images, or not
         if all([isinstance(img, str) for img in images]):
             if preload_images:
-                self._images = [self._get_image(file) for file in tqdm(images)]
+                if _HAS_NUMBA:
+                    # load the raw images, then normalize the whole batch
+                    # in one parallel numba kernel
+                    raw = np.empty(
+                        (len(images),) + tuple(output_shape) + (3,),
+                        dtype=np.float32,
+                    )
+                    load = lambda f: _load_image(f, output_shape=output_shape)
+                    with ThreadPoolExecutor() as executor:
+                        loader = executor.map(load, images)
+                        for idx, image in enumerate(
+                            tqdm(loader, total=len(images))
+                        ):
+                            raw[idx] = image
+                    self._images = _normalize_batch(raw)
+                else:
+                    # store the patches in one contiguous uint8 array
+                    # rather than a list of per-image arrays
+                    self._images = np.empty(
+                        (len(images),) + tuple(output_shape) + (3,),
+                        dtype=np.uint8,
+                    )
+
+                    # image decoding releases the GIL, so threads
+                    # parallelize the disk + decode + resize work
+                    with ThreadPoolExecutor() as executor:
+                        loader = executor.map(self._get_image, images)
+                        for idx, image in enumerate(
+                            tqdm(loader, total=len(images))
+                        ):
+                            self._images[idx] = image
         else:
             if not isinstance(images, np.ndarray):
                 raise ValueError("Image type unknown.")
             self._images = images
 
+    def _load_and_normalize(self, filename: str) -> np.ndarray:
+        """Load an image, reshape to the output shape and normalize."""
+
+        image = _load_image(filename, output_shape=self._output_shape)
+
+        # normalize each channel with a single axis reduction
+        mu = image.mean(axis=(0, 1), keepdims=True)
+        sd = np.maximum(image.std(axis=(0, 1), keepdims=True), self._min_std)
+        image = np.clip((image - mu) / sd, -4.0, 4.0)
+
+        # TODO(arl): ????
+        image = np.clip(255.0 * ((image + 1.0) / 5.0), 0, 255).astype(np.uint8)
+        return image
+
     def _get_image(self, filename: str) -> np.ndarray:
         """Grab an image and resize it."""
-        return _load_and_normalize(filename, output_shape=self._output_shape)
+        return self._load_and_normalize(filename)
+
+    def _scratch_buffer(self, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        """Return a zeroed scratch buffer, reusing the allocation from a
+        previous call when the shape and dtype match."""
+        key = (tuple(shape), np.dtype(dtype).str)
+        if key not in self._scratch:
+            self._scratch[key] = np.zeros(shape, dtype=dtype)
+        buffer = self._scratch[key]
+        buffer[...] = 0
+        return buffer
 
     def __call__(
         self, manifold: np.ndarray, bins: int = 32, components: tuple = (0, 1)
@@ -80,7 +202,8 @@ class ManifoldProjection2D:
         -------
         imgrid : np.ndarray
             An image with example image patches from the manifold arranged on a
-            grid.
+            grid. This is an internal buffer that is reused by subsequent
+            calls, copy it if it needs to persist.
         extent : tuple
             Delimits the minimum and maximum bin edges, in each dimension, used
             to create the result.
@@ -88,61 +211,77 @@ class ManifoldProjection2D:
 
         assert manifold.shape[0] == len(self._images)
 
-        # bin the manifold
-        s, xe, ye, bn = binned_statistic_2d(
-            manifold[:, components[0]],
-            manifold[:, components[1]],
-            [],
-            bins=bins,
-            statistic="count",
-            expand_binnumbers=True,
-        )
+        # bin the manifold on uniform edges with a branchless binary search,
+        # avoiding the SciPy wrapper and its unused count statistic
+        x = manifold[:, components[0]]
+        y = manifold[:, components[1]]
+        xe = np.linspace(x.min(), x.max(), bins + 1)
+        ye = np.linspace(y.min(), y.max(), bins + 1)
+        bx = np.clip(np.searchsorted(xe, x, side="right") - 1, 0, bins - 1)
+        by = np.clip(np.searchsorted(ye, y, side="right") - 1, 0, bins - 1)
+        flat = bx * bins + by
+
+        # the images are already a contiguous (N, H, W, C) array
+        tile_shape = np.shape(self._images)[1:]
 
-        bxy = zip(bn[0, :].tolist(), bn[1, :].tolist())
+        if _HAS_CUPY:
+            # one upload of the uint8 images, a scatter-add reduction on
+            # the device, and one download of the per-bin means
+            imgs = cp.asarray(self._images).astype(cp.float32)
+            flat_gpu = cp.asarray(flat)
+            sums = cp.zeros((bins * bins,) + tile_shape, dtype=cp.float32)
+            scatter_add(sums, flat_gpu, imgs)
+            counts = cp.maximum(cp.bincount(flat_gpu, minlength=bins * bins), 1)
+            mean = cp.asnumpy(
+                sums / counts[:, np.newaxis, np.newaxis, np.newaxis]
+            )
+        else:
+            # keep the images as uint8, summing into uint32 accumulators is
+            # exact and uses a fraction of the float64 bandwidth
+            imgs = np.asarray(self._images)
+            if imgs.dtype != np.uint8:
+                imgs = np.clip(imgs, 0, 255).astype(np.uint8)
+
+            # bucket-sort the images by bin index, so that each occupied
+            # bin reduces over a contiguous slice rather than a scatter-add
+            order = np.argsort(flat, kind="stable")
+            imgs_sorted = imgs[order]
+            uniq, starts, counts = np.unique(
+                flat[order], return_index=True, return_counts=True
+            )
 
-        # make a lookup dictionary
-        grid = {}
-        for idx, b in enumerate(bxy):
-            if b not in grid:
-                grid[b] = []
+            # empty bins are left as zeros
+            mean = self._scratch_buffer((bins * bins,) + tile_shape)
+            for u, start, count in zip(uniq, starts, counts):
+                tile = imgs_sorted[start : start + count].sum(
+                    axis=0, dtype=np.uint32
+                )
+                mean[u] = tile // count
 
-            if self._images is not None:
-                grid[b].append(self._images[idx])
-            else:
-                if not grid[b]:
-                    grid[b].append(self._get_image(self._image_files[idx]))
+        mean = mean.reshape((bins, bins) + tile_shape)
 
         # now make the grid image
         full_bins = [int(b) for b in self._output_shape]
         half_bins = [b // 2 for b in self._output_shape]
-        imgrid = np.zeros(
+        imgrid = self._scratch_buffer(
             (
                 (full_bins[0] + 1) * bins + half_bins[0],
                 (full_bins[1] + 1) * bins + half_bins[1],
                 3,
-            ),
-            dtype="uint8",
-        )
-
-        # build it
-        for xy, images in tqdm(grid.items()):
-
-            stack = np.stack(images, axis=0)
-            im = np.mean(stack, axis=0)
-
-            xx, yy = xy
-            blockx = slice(
-                xx * full_bins[0] - half_bins[0],
-                (xx + 1) * full_bins[0] - half_bins[0],
-                1,
-            )
-            blocky = slice(
-                yy * full_bins[1] - half_bins[1],
-                (yy + 1) * full_bins[1] - half_bins[1],
-                1,
             )
+        )
 
-            imgrid[blockx, blocky, :] = im
+        # tile the (bins, bins, H, W, 3) block into a single contiguous
+        # montage, then copy it into the grid image in one pass
+        montage = mean.transpose(0, 2, 1, 3, 4).reshape(
+            bins * full_bins[0], bins * full_bins[1], 3
+        )
+        offsets = [f - h for f, h in zip(full_bins, half_bins)]
+        imgrid[
+            offsets[0] : offsets[0] + bins * full_bins[0],
+            offsets[1] : offsets[1] + bins * full_bins[1],
+            :,
+        ] = montage
 
         extent = (min(xe), max(xe), min(ye), max(ye))
 